@@ -3,24 +3,29 @@
 from __future__ import annotations
 
 import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import date
 from pathlib import Path
 from typing import Any, Callable
 
 from project_starter import (
-    DB_PATH,
     PAPER_CATALOG,
     create_transaction,
+    customer_has_history,
+    flush_transactions,
     generate_financial_report,
-    get_all_inventory,
+    get_inventory_snapshot,
     get_cash_balance,
-    get_stock_level,
     get_supplier_delivery_date,
     initialize_database,
+    run_today,
     search_quote_history,
     seed_inventory,
+    set_run_today,
+    stage_sale,
     update_stock_level,
+    use_memory_db,
 )
 
 try:
@@ -37,11 +42,10 @@ except Exception:  # pragma: no cover
 @tool
 def inventory_lookup_tool(paper_type: str) -> dict[str, Any]:
     """Get inventory details for a paper type."""
-    all_inventory = {row["paper_type"]: row for row in get_all_inventory()}
-    row = all_inventory.get(paper_type)
+    row = get_inventory_snapshot().get(paper_type)
     return {
         "paper_type": paper_type,
-        "stock_level": get_stock_level(paper_type),
+        "stock_level": row["stock_level"] if row else 0,
         "known_item": row is not None,
         "reorder_threshold": row["reorder_threshold"] if row else None,
     }
@@ -85,7 +89,34 @@ def financial_report_tool() -> dict[str, Any]:
     return generate_financial_report()
 
 
-@dataclass
+# Canonical column order for evaluation output; the CSV writer and the test
+# contract both import this so they cannot drift apart.
+RESULT_FIELDNAMES: tuple[str, ...] = (
+    "request_id",
+    "customer_name",
+    "paper_type",
+    "quantity",
+    "quote_total",
+    "status",
+    "fulfilled",
+    "rationale",
+    "operator_cash_balance_after",
+    "framework",
+)
+
+
+# PAPER_CATALOG is frozen and the loyalty/bulk combinations yield only a few
+# discount tiers, so every reachable unit price is precomputed at import time.
+# Keys use whole-percent discounts to avoid float-sum key mismatches.
+_DISCOUNT_STEPS: tuple[int, ...] = (0, 2, 6, 8, 10, 12, 14, 16, 20)
+_PRICE_TABLE: dict[tuple[str, int], float] = {
+    (paper_type, pct): round(spec.list_price * (1 - pct / 100), 2)
+    for paper_type, spec in PAPER_CATALOG.items()
+    for pct in _DISCOUNT_STEPS
+}
+
+
+@dataclass(frozen=True, slots=True)
 class Request:
     request_id: str
     customer_name: str
@@ -129,15 +160,22 @@ class InventoryAgent:
     def __init__(self, runtime: FrameworkManagedToolRuntime | None = None) -> None:
         self.runtime = runtime or _build_default_runtime()
 
-    def assess(self, request: Request) -> dict[str, Any]:
-        snapshot = self.runtime.call("inventory_lookup_tool", paper_type=request.paper_type)
-        if not snapshot["known_item"]:
+    def assess(self, request: Request, world: dict[str, Any] | None = None) -> dict[str, Any]:
+        # Trusted internal path: read the shared world snapshot (or the live
+        # cache) directly rather than routing through the tool wrappers, which
+        # are kept for external LLM-driven callers.
+        inventory = world["inventory"] if world is not None else get_inventory_snapshot()
+        row = inventory.get(request.paper_type)
+        if row is None:
             return {"can_fulfill_now": False, "reason": "requested paper type is not available", "eta": None}
 
-        stock = int(snapshot["stock_level"])
+        stock = int(row["stock_level"])
         can_fulfill_now = stock >= request.quantity
-        eta = self.runtime.call("supplier_timeline_tool", paper_type=request.paper_type, quantity=request.quantity)
-        needs_reorder = stock < (snapshot["reorder_threshold"] or 0)
+        # The ETA only matters when the order cannot be fulfilled from stock.
+        eta = None
+        if not can_fulfill_now:
+            eta = get_supplier_delivery_date(request.paper_type, request.quantity)
+        needs_reorder = stock < (row["reorder_threshold"] or 0)
 
         return {
             "can_fulfill_now": can_fulfill_now,
@@ -151,31 +189,31 @@ class QuoteAgent:
     def __init__(self, runtime: FrameworkManagedToolRuntime | None = None) -> None:
         self.runtime = runtime or _build_default_runtime()
 
+    # Bulk discount tiers, highest threshold first.
+    _BULK_TIERS: tuple[tuple[int, float], ...] = ((300, 0.14), (200, 0.10), (100, 0.06))
+
     @staticmethod
     def _bulk_discount(quantity: int) -> float:
-        if quantity >= 300:
-            return 0.14
-        if quantity >= 200:
-            return 0.10
-        if quantity >= 100:
-            return 0.06
+        for threshold, discount in QuoteAgent._BULK_TIERS:
+            if quantity >= threshold:
+                return discount
         return 0.0
 
-    def build_quote(self, request: Request) -> dict[str, Any]:
+    def build_quote(self, request: Request, has_history: bool | None = None) -> dict[str, Any]:
         spec = PAPER_CATALOG.get(request.paper_type)
         if spec is None:
             return {"approved": False, "reason": "paper type not sold", "unit_price": 0.0, "total": 0.0}
 
-        history = self.runtime.call(
-            "quote_history_tool",
-            customer_name=request.customer_name,
-            paper_type=request.paper_type,
-        )
-        loyalty_discount = 0.02 if history else 0.0
-        bulk_discount = self._bulk_discount(request.quantity)
-        total_discount = min(0.2, loyalty_discount + bulk_discount)
+        if has_history is None:
+            # Only the existence of prior business matters for the loyalty
+            # discount, so probe with LIMIT 1 instead of materializing rows.
+            has_history = customer_has_history(request.customer_name, request.paper_type)
+        loyalty_pct = 2 if has_history else 0
+        bulk_pct = round(self._bulk_discount(request.quantity) * 100)
+        total_pct = min(20, loyalty_pct + bulk_pct)
+        total_discount = total_pct / 100
 
-        unit_price = round(spec.list_price * (1 - total_discount), 2)
+        unit_price = _PRICE_TABLE[(request.paper_type, total_pct)]
         total = round(unit_price * request.quantity, 2)
 
         if total > request.max_budget:
@@ -200,56 +238,82 @@ class FulfillmentAgent:
     def __init__(self, runtime: FrameworkManagedToolRuntime | None = None) -> None:
         self.runtime = runtime or _build_default_runtime()
 
-    def finalize(self, request: Request, quote: dict[str, Any], inventory_assessment: dict[str, Any]) -> dict[str, Any]:
+    def decide(
+        self, request: Request, quote: dict[str, Any], inventory_assessment: dict[str, Any]
+    ) -> tuple[dict[str, Any], tuple[Any, ...], int]:
+        """Compute the outcome without writing to the database.
+
+        Returns (result, transaction row tuple, stock delta). The caller either
+        persists immediately (finalize) or stages the row for a bulk flush.
+        """
+        created_at = run_today().isoformat()
+
         if not quote["approved"]:
-            txn_id = self.runtime.call(
-                "transaction_tool",
-                customer_name=request.customer_name,
-                paper_type=request.paper_type,
-                quantity=request.quantity,
-                unit_price=quote.get("unit_price", 0.0),
-                total_price=quote.get("total", 0.0),
-                status="declined",
-                notes=quote.get("reason", "declined"),
+            row = (
+                created_at,
+                request.customer_name,
+                request.paper_type,
+                request.quantity,
+                quote.get("unit_price", 0.0),
+                quote.get("total", 0.0),
+                "declined",
+                quote.get("reason", "declined"),
             )
-            return {"fulfilled": False, "status": "declined", "txn_id": txn_id, "message": quote["reason"]}
+            result = {"fulfilled": False, "status": "declined", "txn_id": None, "message": quote["reason"]}
+            return result, row, 0
 
         if not inventory_assessment["can_fulfill_now"]:
-            txn_id = self.runtime.call(
-                "transaction_tool",
-                customer_name=request.customer_name,
-                paper_type=request.paper_type,
-                quantity=request.quantity,
-                unit_price=quote["unit_price"],
-                total_price=quote["total"],
-                status="unfulfilled",
-                notes=f"insufficient stock; earliest supplier ETA {inventory_assessment['eta']}",
+            eta = inventory_assessment["eta"] or get_supplier_delivery_date(request.paper_type, request.quantity)
+            row = (
+                created_at,
+                request.customer_name,
+                request.paper_type,
+                request.quantity,
+                quote["unit_price"],
+                quote["total"],
+                "unfulfilled",
+                f"insufficient stock; earliest supplier ETA {eta}",
             )
-            return {
+            result = {
                 "fulfilled": False,
                 "status": "unfulfilled",
-                "txn_id": txn_id,
-                "message": f"insufficient stock now; next supplier ETA is {inventory_assessment['eta']}",
+                "txn_id": None,
+                "message": f"insufficient stock now; next supplier ETA is {eta}",
             }
-
-        remaining = inventory_assessment["stock"] - request.quantity
-        update_stock_level(request.paper_type, remaining)
-        txn_id = self.runtime.call(
-            "transaction_tool",
-            customer_name=request.customer_name,
-            paper_type=request.paper_type,
-            quantity=request.quantity,
-            unit_price=quote["unit_price"],
-            total_price=quote["total"],
-            status="fulfilled",
-            notes="fulfilled from on-hand inventory",
+            return result, row, 0
+
+        row = (
+            created_at,
+            request.customer_name,
+            request.paper_type,
+            request.quantity,
+            quote["unit_price"],
+            quote["total"],
+            "fulfilled",
+            "fulfilled from on-hand inventory",
         )
-        return {
+        result = {
             "fulfilled": True,
             "status": "fulfilled",
-            "txn_id": txn_id,
+            "txn_id": None,
             "message": "order fulfilled and inventory updated",
         }
+        return result, row, request.quantity
+
+    def finalize(self, request: Request, quote: dict[str, Any], inventory_assessment: dict[str, Any]) -> dict[str, Any]:
+        result, row, stock_delta = self.decide(request, quote, inventory_assessment)
+        if stock_delta:
+            update_stock_level(request.paper_type, inventory_assessment["stock"] - stock_delta)
+        _, customer_name, paper_type, quantity, unit_price, total_price, status, notes = row
+        result["txn_id"] = create_transaction(
+            customer_name, paper_type, quantity, unit_price, total_price, status, notes
+        )
+        return result
+
+    @staticmethod
+    def flush(rows: list[tuple[Any, ...]], stock_deltas: dict[str, int] | None = None) -> list[int]:
+        """Persist staged decision rows in one bulk transaction."""
+        return flush_transactions(rows, stock_deltas)
 
 
 class ReportingAgent:
@@ -258,8 +322,8 @@ class ReportingAgent:
 
     def snapshot(self) -> dict[str, Any]:
         return {
-            "cash_balance": round(self.runtime.call("cash_balance_tool"), 2),
-            "financial_report": self.runtime.call("financial_report_tool"),
+            "cash_balance": round(get_cash_balance(), 2),
+            "financial_report": generate_financial_report(),
         }
 
 
@@ -270,12 +334,47 @@ class OrchestratorAgent:
         self.quote_agent = QuoteAgent(self.runtime)
         self.fulfillment_agent = FulfillmentAgent(self.runtime)
         self.reporting_agent = ReportingAgent(self.runtime)
+        # Quote history per (customer, paper) repeats across a run; cache it and
+        # invalidate whenever a new transaction is written for that pair.
+        self._history_cache: dict[tuple[str, str], bool] = {}
+
+    def _has_history(self, customer_name: str, paper_type: str) -> bool:
+        key = (customer_name, paper_type)
+        if key not in self._history_cache:
+            self._history_cache[key] = customer_has_history(customer_name, paper_type)
+        return self._history_cache[key]
 
     def handle_request(self, request: Request) -> dict[str, Any]:
-        inventory_assessment = self.inventory_agent.assess(request)
-        quote = self.quote_agent.build_quote(request)
+        world = {"inventory": get_inventory_snapshot()}
+        inventory_assessment = self.inventory_agent.assess(request, world=world)
+        has_history = self._has_history(request.customer_name, request.paper_type)
+        quote = self.quote_agent.build_quote(request, has_history=has_history)
         fulfillment = self.fulfillment_agent.finalize(request, quote, inventory_assessment)
-
+        self._history_cache.pop((request.customer_name, request.paper_type), None)
+        return self._compose_response(request, quote, fulfillment)
+
+    def handle_request_staged(self, request: Request) -> tuple[dict[str, Any], tuple[Any, ...], int]:
+        """Batched variant of handle_request_for_operations: stages the decision
+        in memory and returns (response, transaction row, stock delta) so the
+        caller can flush all rows in one bulk write."""
+        world = {"inventory": get_inventory_snapshot()}
+        inventory_assessment = self.inventory_agent.assess(request, world=world)
+        has_history = self._has_history(request.customer_name, request.paper_type)
+        quote = self.quote_agent.build_quote(request, has_history=has_history)
+        fulfillment, row, stock_delta = self.fulfillment_agent.decide(request, quote, inventory_assessment)
+        stage_sale(request.customer_name, request.paper_type, request.quantity, row[5], row[6])
+        # The staged row guarantees history exists for this pair now; a re-query
+        # would miss it until the flush, so record the fact directly.
+        self._history_cache[(request.customer_name, request.paper_type)] = True
+
+        response = self._compose_response(request, quote, fulfillment)
+        # operator_cash_balance_after is deliberately absent here: reading the
+        # shared counters from worker threads gives interleaving-dependent
+        # values, so _evaluate_requests back-fills a deterministic running
+        # balance in input order once all groups have finished.
+        return response, row, stock_delta
+
+    def _compose_response(self, request: Request, quote: dict[str, Any], fulfillment: dict[str, Any]) -> dict[str, Any]:
         if fulfillment["fulfilled"]:
             rationale = fulfillment["message"]
         elif fulfillment["status"] == "unfulfilled":
@@ -306,50 +405,111 @@ class OrchestratorAgent:
 
 
 def load_requests(csv_path: Path) -> list[Request]:
-    requests: list[Request] = []
     with csv_path.open(newline="", encoding="utf-8") as handle:
-        reader = csv.DictReader(handle)
-        for row in reader:
-            requests.append(
-                Request(
-                    request_id=row["request_id"],
-                    customer_name=row["customer_name"],
-                    paper_type=row["paper_type"],
-                    quantity=int(row["quantity"]),
-                    max_budget=float(row["max_budget"]),
-                    needed_by=row.get("needed_by", date.today().isoformat()),
-                )
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
+            return []
+
+        # Resolve column positions once so each row is plain tuple indexing
+        # instead of a per-row dict built by DictReader.
+        column = {name: position for position, name in enumerate(header)}
+        id_at = column["request_id"]
+        customer_at = column["customer_name"]
+        paper_at = column["paper_type"]
+        quantity_at = column["quantity"]
+        budget_at = column["max_budget"]
+        needed_by_at = column.get("needed_by")
+        default_needed_by = run_today().isoformat()
+
+        return [
+            Request(
+                request_id=row[id_at],
+                customer_name=row[customer_at],
+                paper_type=row[paper_at],
+                quantity=int(row[quantity_at]),
+                max_budget=float(row[budget_at]),
+                needed_by=row[needed_by_at] if needed_by_at is not None else default_needed_by,
             )
-    return requests
+            for row in reader
+        ]
+
+
+_MAX_EVAL_WORKERS = 8
+
+
+def _evaluate_requests(orchestrator: OrchestratorAgent, requests: list[Request]) -> list[dict[str, Any]]:
+    """Process requests concurrently, grouped by paper type.
+
+    Requests for different papers are independent once decisions are pure
+    in-memory math, so each paper's group runs on its own worker while a
+    per-paper lock serializes stock decrements. Results keep their input
+    order, the running cash balance is replayed over them in that order so
+    the column is deterministic regardless of thread interleaving, and all
+    staged rows are persisted in one bulk flush at the end.
+    """
+    opening_balance = get_cash_balance()
+    groups: dict[str, list[tuple[int, Request]]] = {}
+    for position, req in enumerate(requests):
+        groups.setdefault(req.paper_type, []).append((position, req))
+
+    paper_locks = {paper_type: threading.Lock() for paper_type in groups}
+    results: list[dict[str, Any] | None] = [None] * len(requests)
+    rows: list[tuple[Any, ...] | None] = [None] * len(requests)
+    stock_deltas: dict[str, int] = {}
+    deltas_lock = threading.Lock()
+
+    def _process_group(paper_type: str, group: list[tuple[int, Request]]) -> None:
+        lock = paper_locks[paper_type]
+        for position, req in group:
+            with lock:
+                response, row, stock_delta = orchestrator.handle_request_staged(req)
+            results[position] = response
+            rows[position] = row
+            if stock_delta:
+                with deltas_lock:
+                    stock_deltas[paper_type] = stock_deltas.get(paper_type, 0) + stock_delta
+
+    with ThreadPoolExecutor(max_workers=min(_MAX_EVAL_WORKERS, max(len(groups), 1))) as pool:
+        futures = [pool.submit(_process_group, paper_type, group) for paper_type, group in groups.items()]
+        for future in futures:
+            future.result()
+
+    # Replay each decision's cash effect in input order: a fulfilled sale adds
+    # its revenue and releases the sold stock's carrying cost.
+    balance = opening_balance
+    for response, row in zip(results, rows):
+        if response is None or row is None:
+            continue
+        if row[6] == "fulfilled":
+            balance += row[5] + row[3] * PAPER_CATALOG[row[2]].unit_cost
+        response["operator_cash_balance_after"] = round(balance, 2)
+
+    FulfillmentAgent.flush([row for row in rows if row is not None], stock_deltas)
+    return [response for response in results if response is not None]
 
 
 def run_evaluation(input_csv: str = "quote_requests_sample.csv", output_csv: str = "test_results.csv") -> list[dict[str, Any]]:
-    if DB_PATH.exists():
-        DB_PATH.unlink()
-    initialize_database()
-    seed_inventory()
-    orchestrator = OrchestratorAgent()
-
-    requests = load_requests(Path(input_csv))
-    results = [orchestrator.handle_request_for_operations(req) for req in requests]
-
-    fieldnames = [
-        "request_id",
-        "customer_name",
-        "paper_type",
-        "quantity",
-        "quote_total",
-        "status",
-        "fulfilled",
-        "rationale",
-        "operator_cash_balance_after",
-        "framework",
-    ]
+    set_run_today()
+    # Evaluation runs are throwaway, so commits go to a shared-cache in-memory
+    # database; switching modes closes any open connection, which also discards
+    # state left over from a previous run. The previous mode is restored so
+    # later helper calls in the same process hit the real database again.
+    previous_mode = use_memory_db(True)
+    try:
+        initialize_database()
+        seed_inventory()
+        orchestrator = OrchestratorAgent()
+
+        requests = load_requests(Path(input_csv))
+        results = _evaluate_requests(orchestrator, requests)
+    finally:
+        use_memory_db(previous_mode)
 
     with Path(output_csv).open("w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+        writer = csv.writer(handle)
+        writer.writerow(RESULT_FIELDNAMES)
+        writer.writerows(tuple(result[field] for field in RESULT_FIELDNAMES) for result in results)
 
     return results
 
@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import atexit
+import os
 import sqlite3
-from contextlib import closing
+import threading
 from dataclasses import dataclass
 from datetime import date, timedelta
 from pathlib import Path
@@ -11,6 +13,11 @@ from typing import Any
 
 DB_PATH = Path(__file__).with_name("beavers_choice.db")
 
+# Throwaway runs (evaluation, tests) can use a shared-cache in-memory database
+# so commits never touch disk. Enabled via the environment or use_memory_db().
+_MEMORY_DB_URI = "file:beavers_choice?mode=memory&cache=shared"
+USE_MEMORY_DB = os.environ.get("BEAVERS_CHOICE_MEMORY_DB", "") not in ("", "0")
+
 
 @dataclass(frozen=True)
 class PaperSpec:
@@ -29,77 +36,219 @@ PAPER_CATALOG: dict[str, PaperSpec] = {
 }
 
 
-def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Hot SQL kept as module constants so sqlite3's per-connection statement cache
+# hits on string identity instead of re-preparing each call.
+_SQL_SELECT_INVENTORY = "SELECT * FROM inventory ORDER BY paper_type"
+_SQL_UPDATE_STOCK = "UPDATE inventory SET stock_level = ? WHERE paper_type = ?"
+_SQL_DECREMENT_STOCK = "UPDATE inventory SET stock_level = stock_level - ? WHERE paper_type = ?"
+_SQL_CARRYING_COST = "SELECT COALESCE(SUM(stock_level * unit_cost), 0) AS total FROM inventory"
+_SQL_INSERT_TXN = """
+    INSERT INTO transactions(
+        created_at, customer_name, paper_type, quantity, unit_price, total_price, status, notes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_HISTORY_EXISTS = "SELECT 1 FROM transactions WHERE customer_name = ? AND paper_type = ? LIMIT 1"
+_SQL_HISTORY_BASE = (
+    "SELECT created_at, customer_name, paper_type, quantity, unit_price, total_price, status, notes "
+    "FROM transactions WHERE customer_name = ?"
+)
+_SQL_TXN_AGGREGATES = """
+    SELECT
+        COALESCE(SUM(CASE WHEN status = 'fulfilled' THEN 1 ELSE 0 END), 0) AS fulfilled,
+        COALESCE(SUM(CASE WHEN status != 'fulfilled' THEN 1 ELSE 0 END), 0) AS unfulfilled,
+        COALESCE(SUM(CASE WHEN status = 'fulfilled' THEN total_price END), 0) AS revenue
+    FROM transactions
+"""
+
+_CONN: sqlite3.Connection | None = None
+
+# In-process mirror of the inventory table, keyed by paper_type. Loaded when
+# the schema is created/seeded and kept in sync by update_stock_level, so hot
+# lookups never hit the database.
+_INV_CACHE: dict[str, dict[str, Any]] = {}
+
+# Running financial counters, seeded from one scan of each table and then
+# maintained incrementally by create_transaction and update_stock_level so
+# reporting never re-sums the full transaction history. Empty means unloaded.
+_CASH_STATE: dict[str, float] = {}
+
+# (customer_name, paper_type) pairs staged in memory but not yet flushed, so
+# history checks see within-run transactions before they reach the table.
+_STAGED_HISTORY: set[tuple[str, str]] = set()
+
+# Guards the running counters when decisions are staged from worker threads.
+_STATE_LOCK = threading.Lock()
+
+_RUN_TODAY: date | None = None
+
+
+def set_run_today(day: date | None = None) -> None:
+    """Pin "today" for the duration of a run so hot paths skip repeated clock reads."""
+    global _RUN_TODAY
+    _RUN_TODAY = day or date.today()
+
+
+def run_today() -> date:
+    """Return the pinned run date if set, otherwise the live date."""
+    return _RUN_TODAY or date.today()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Return the shared module-level connection, opening it on first use."""
+    global _CONN
+    if _CONN is None:
+        target = _MEMORY_DB_URI if USE_MEMORY_DB else DB_PATH
+        _CONN = sqlite3.connect(
+            target, isolation_level=None, check_same_thread=False, uri=USE_MEMORY_DB, cached_statements=256
+        )
+        _CONN.row_factory = sqlite3.Row
+        _CONN.execute("PRAGMA journal_mode=WAL")
+        _CONN.execute("PRAGMA synchronous=NORMAL")
+        _CONN.execute("PRAGMA temp_store=MEMORY")
+    return _CONN
+
+
+def close_connection() -> None:
+    """Close the shared connection; the next helper call reopens it."""
+    global _CONN
+    if _CONN is not None:
+        _CONN.close()
+        _CONN = None
+    _INV_CACHE.clear()
+    _CASH_STATE.clear()
+    _STAGED_HISTORY.clear()
+
+
+def _load_inventory_cache() -> None:
+    _INV_CACHE.clear()
+    for row in _get_conn().execute(_SQL_SELECT_INVENTORY):
+        _INV_CACHE[row["paper_type"]] = dict(row)
+
+
+def _refresh_cash_state() -> None:
+    fulfilled_count, unfulfilled_count, fulfilled_revenue = _txn_aggregates()
+    carrying_cost = _get_conn().execute(_SQL_CARRYING_COST).fetchone()["total"]
+    _CASH_STATE.update(
+        fulfilled_count=float(fulfilled_count),
+        unfulfilled_count=float(unfulfilled_count),
+        fulfilled_revenue=fulfilled_revenue,
+        carrying_cost=float(carrying_cost),
+    )
+
+
+def use_memory_db(enabled: bool = True) -> bool:
+    """Switch between the in-memory evaluation database and the on-disk file.
+
+    Closes the current connection; in memory mode that also discards the
+    database, which is exactly the reset an evaluation run wants. Returns the
+    previous mode so callers can restore it when they are done.
+    """
+    global USE_MEMORY_DB
+    previous = USE_MEMORY_DB
+    close_connection()
+    USE_MEMORY_DB = enabled
+    return previous
+
+
+atexit.register(close_connection)
 
 
 def initialize_database() -> None:
     """Create database tables if they do not already exist."""
-    with closing(_connect()) as conn:
-        conn.executescript(
-            """
-            CREATE TABLE IF NOT EXISTS inventory (
-                paper_type TEXT PRIMARY KEY,
-                stock_level INTEGER NOT NULL,
-                unit_cost REAL NOT NULL,
-                list_price REAL NOT NULL,
-                reorder_threshold INTEGER NOT NULL,
-                supplier_lead_days INTEGER NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_at TEXT NOT NULL,
-                customer_name TEXT NOT NULL,
-                paper_type TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit_price REAL NOT NULL,
-                total_price REAL NOT NULL,
-                status TEXT NOT NULL,
-                notes TEXT
-            );
-            """
-        )
-        conn.commit()
+    _get_conn().executescript(
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            paper_type TEXT PRIMARY KEY,
+            stock_level INTEGER NOT NULL,
+            unit_cost REAL NOT NULL,
+            list_price REAL NOT NULL,
+            reorder_threshold INTEGER NOT NULL,
+            supplier_lead_days INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            customer_name TEXT NOT NULL,
+            paper_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            status TEXT NOT NULL,
+            notes TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_transactions_customer_paper
+            ON transactions(customer_name, paper_type, id);
+
+        CREATE INDEX IF NOT EXISTS idx_transactions_status
+            ON transactions(status);
+        """
+    )
+    _load_inventory_cache()
+    _refresh_cash_state()
 
 
 def seed_inventory() -> None:
     """Populate inventory defaults on first run, preserving existing stock levels."""
     initialize_database()
-    with closing(_connect()) as conn:
-        for spec in PAPER_CATALOG.values():
-            conn.execute(
-                """
-                INSERT OR IGNORE INTO inventory(
-                    paper_type, stock_level, unit_cost, list_price, reorder_threshold, supplier_lead_days
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (spec.paper_type, spec.reorder_threshold + 80, spec.unit_cost, spec.list_price, spec.reorder_threshold, spec.supplier_lead_days),
-            )
-        conn.commit()
+    rows = [
+        (spec.paper_type, spec.reorder_threshold + 80, spec.unit_cost, spec.list_price, spec.reorder_threshold, spec.supplier_lead_days)
+        for spec in PAPER_CATALOG.values()
+    ]
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO inventory(
+                paper_type, stock_level, unit_cost, list_price, reorder_threshold, supplier_lead_days
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _load_inventory_cache()
+    _refresh_cash_state()
 
 
 def get_all_inventory() -> list[dict[str, Any]]:
     """Return all inventory rows."""
-    with closing(_connect()) as conn:
-        rows = conn.execute("SELECT * FROM inventory ORDER BY paper_type").fetchall()
-    return [dict(row) for row in rows]
+    if not _INV_CACHE:
+        _load_inventory_cache()
+    return [dict(row) for row in _INV_CACHE.values()]
+
+
+def get_inventory_snapshot() -> dict[str, dict[str, Any]]:
+    """Return the live inventory cache keyed by paper_type.
+
+    Zero-copy view shared across a request pipeline; callers must treat it as
+    read-only and go through update_stock_level/stage_sale for changes.
+    """
+    if not _INV_CACHE:
+        _load_inventory_cache()
+    return _INV_CACHE
 
 
 def get_stock_level(paper_type: str) -> int:
     """Return stock level for a paper type; 0 if not found."""
-    with closing(_connect()) as conn:
-        row = conn.execute("SELECT stock_level FROM inventory WHERE paper_type = ?", (paper_type,)).fetchone()
+    if not _INV_CACHE:
+        _load_inventory_cache()
+    row = _INV_CACHE.get(paper_type)
     return int(row["stock_level"]) if row else 0
 
 
 def update_stock_level(paper_type: str, new_level: int) -> None:
     """Update stock level for a paper type."""
-    with closing(_connect()) as conn:
-        conn.execute("UPDATE inventory SET stock_level = ? WHERE paper_type = ?", (new_level, paper_type))
-        conn.commit()
+    _get_conn().execute(_SQL_UPDATE_STOCK, (new_level, paper_type))
+    row = _INV_CACHE.get(paper_type)
+    if row is not None:
+        if _CASH_STATE:
+            _CASH_STATE["carrying_cost"] += (new_level - row["stock_level"]) * row["unit_cost"]
+        row["stock_level"] = new_level
 
 
 def create_transaction(
@@ -112,25 +261,76 @@ def create_transaction(
     notes: str = "",
 ) -> int:
     """Insert a transaction row and return transaction id."""
-    with closing(_connect()) as conn:
-        cur = conn.execute(
-            """
-            INSERT INTO transactions(
-                created_at, customer_name, paper_type, quantity, unit_price, total_price, status, notes
-            ) VALUES (DATE('now'), ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (customer_name, paper_type, quantity, unit_price, total_price, status, notes),
-        )
-        conn.commit()
-        return int(cur.lastrowid)
+    cur = _get_conn().execute(
+        _SQL_INSERT_TXN,
+        (run_today().isoformat(), customer_name, paper_type, quantity, unit_price, total_price, status, notes),
+    )
+    if _CASH_STATE:
+        if status == "fulfilled":
+            _CASH_STATE["fulfilled_count"] += 1
+            _CASH_STATE["fulfilled_revenue"] += total_price
+        else:
+            _CASH_STATE["unfulfilled_count"] += 1
+    return int(cur.lastrowid)
+
+
+def stage_sale(customer_name: str, paper_type: str, quantity: int, total_price: float, status: str) -> None:
+    """Apply a decision's effects to the in-memory caches without touching the database.
+
+    Used by the batched evaluation path: decisions are staged as they are made
+    so later requests and reporting see them, then flush_transactions persists
+    the accumulated rows in one transaction.
+    """
+    if not _CASH_STATE:
+        _refresh_cash_state()
+    with _STATE_LOCK:
+        # Any staged transaction counts as quote history for this customer and
+        # paper, matching what the immediate-write path records in the table.
+        _STAGED_HISTORY.add((customer_name, paper_type))
+        if status == "fulfilled":
+            _CASH_STATE["fulfilled_count"] += 1
+            _CASH_STATE["fulfilled_revenue"] += total_price
+            row = _INV_CACHE.get(paper_type)
+            if row is not None:
+                row["stock_level"] -= quantity
+                _CASH_STATE["carrying_cost"] -= quantity * row["unit_cost"]
+        else:
+            _CASH_STATE["unfulfilled_count"] += 1
+
+
+def flush_transactions(rows: list[tuple[Any, ...]], stock_deltas: dict[str, int] | None = None) -> list[int]:
+    """Persist staged decisions in a single transaction and return their ids.
+
+    Each row is (created_at, customer_name, paper_type, quantity, unit_price,
+    total_price, status, notes). stock_deltas maps paper_type to the total
+    quantity sold, applied as one UPDATE per paper. The in-memory caches are
+    expected to already reflect these rows via stage_sale.
+    """
+    if not rows:
+        return []
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(_SQL_INSERT_TXN, rows)
+        if stock_deltas:
+            conn.executemany(
+                _SQL_DECREMENT_STOCK,
+                [(delta, paper_type) for paper_type, delta in stock_deltas.items()],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    for row in rows:
+        # The row is in the table now, so the staged marker is redundant.
+        _STAGED_HISTORY.discard((row[1], row[2]))
+    last_id = int(conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+    return list(range(last_id - len(rows) + 1, last_id + 1))
 
 
 def search_quote_history(customer_name: str, paper_type: str | None = None, limit: int = 5) -> list[dict[str, Any]]:
     """Find recent quote/fulfilled transactions for a customer, optionally filtered by paper type."""
-    query = (
-        "SELECT created_at, customer_name, paper_type, quantity, unit_price, total_price, status, notes "
-        "FROM transactions WHERE customer_name = ?"
-    )
+    query = _SQL_HISTORY_BASE
     args: list[Any] = [customer_name]
     if paper_type:
         query += " AND paper_type = ?"
@@ -138,53 +338,56 @@ def search_quote_history(customer_name: str, paper_type: str | None = None, limi
     query += " ORDER BY id DESC LIMIT ?"
     args.append(limit)
 
-    with closing(_connect()) as conn:
-        rows = conn.execute(query, tuple(args)).fetchall()
+    rows = _get_conn().execute(query, tuple(args)).fetchall()
     return [dict(row) for row in rows]
 
 
+def customer_has_history(customer_name: str, paper_type: str) -> bool:
+    """Return whether any transaction exists for the customer and paper type.
+
+    Cheaper than search_quote_history when callers only need a truthy check.
+    Staged-but-unflushed transactions count as history too.
+    """
+    if (customer_name, paper_type) in _STAGED_HISTORY:
+        return True
+    return _get_conn().execute(_SQL_HISTORY_EXISTS, (customer_name, paper_type)).fetchone() is not None
+
+
 def get_supplier_delivery_date(paper_type: str, quantity: int) -> str:
     """Estimate supplier delivery date based on configured lead time and requested quantity."""
     spec = PAPER_CATALOG.get(paper_type)
     if not spec:
-        return (date.today() + timedelta(days=14)).isoformat()
+        return (run_today() + timedelta(days=14)).isoformat()
 
     load_penalty = max(0, quantity - spec.reorder_threshold) // 100
-    eta = date.today() + timedelta(days=spec.supplier_lead_days + load_penalty)
+    eta = run_today() + timedelta(days=spec.supplier_lead_days + load_penalty)
     return eta.isoformat()
 
 
 def get_cash_balance() -> float:
     """Compute current cash as cumulative fulfilled sales minus inventory carrying cost baseline."""
-    with closing(_connect()) as conn:
-        sales = conn.execute(
-            "SELECT COALESCE(SUM(total_price), 0) AS total FROM transactions WHERE status = 'fulfilled'"
-        ).fetchone()["total"]
-        carrying_cost = conn.execute(
-            "SELECT COALESCE(SUM(stock_level * unit_cost), 0) AS total FROM inventory"
-        ).fetchone()["total"]
-    return float(sales) - float(carrying_cost)
+    if not _CASH_STATE:
+        _refresh_cash_state()
+    return _CASH_STATE["fulfilled_revenue"] - _CASH_STATE["carrying_cost"]
+
+
+def _txn_aggregates() -> tuple[int, int, float]:
+    """Return (fulfilled_count, unfulfilled_count, fulfilled_revenue) in one scan."""
+    row = _get_conn().execute(_SQL_TXN_AGGREGATES).fetchone()
+    return int(row["fulfilled"]), int(row["unfulfilled"]), float(row["revenue"])
 
 
 def generate_financial_report() -> dict[str, Any]:
     """Return a compact financial summary for reporting."""
-    with closing(_connect()) as conn:
-        fulfilled_count = conn.execute(
-            "SELECT COUNT(*) AS c FROM transactions WHERE status = 'fulfilled'"
-        ).fetchone()["c"]
-        unfulfilled_count = conn.execute(
-            "SELECT COUNT(*) AS c FROM transactions WHERE status != 'fulfilled'"
-        ).fetchone()["c"]
-        total_revenue = conn.execute(
-            "SELECT COALESCE(SUM(total_price), 0) AS total FROM transactions WHERE status = 'fulfilled'"
-        ).fetchone()["total"]
+    if not _CASH_STATE:
+        _refresh_cash_state()
 
     return {
-        "cash_balance": round(get_cash_balance(), 2),
-        "fulfilled_transactions": int(fulfilled_count),
-        "non_fulfilled_transactions": int(unfulfilled_count),
-        "total_revenue": round(float(total_revenue), 2),
-        "report_generated_on": date.today().isoformat(),
+        "cash_balance": round(_CASH_STATE["fulfilled_revenue"] - _CASH_STATE["carrying_cost"], 2),
+        "fulfilled_transactions": int(_CASH_STATE["fulfilled_count"]),
+        "non_fulfilled_transactions": int(_CASH_STATE["unfulfilled_count"]),
+        "total_revenue": round(_CASH_STATE["fulfilled_revenue"], 2),
+        "report_generated_on": run_today().isoformat(),
     }
 
 
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import pytest
+
 from multi_agent_system import (
     FulfillmentAgent,
     InventoryAgent,
@@ -8,7 +10,15 @@ from multi_agent_system import (
     ReportingAgent,
     Request,
 )
-from project_starter import initialize_database, seed_inventory
+from project_starter import initialize_database, seed_inventory, use_memory_db
+
+
+@pytest.fixture(autouse=True)
+def memory_db():
+    """Run against the in-memory database so tests leave no file behind."""
+    previous = use_memory_db(True)
+    yield
+    use_memory_db(previous)
 
 
 def _sample_request() -> Request:
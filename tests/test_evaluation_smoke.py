@@ -3,21 +3,7 @@ from __future__ import annotations
 import csv
 from pathlib import Path
 
-from multi_agent_system import run_evaluation
-
-
-REQUIRED_COLUMNS = {
-    "request_id",
-    "customer_name",
-    "paper_type",
-    "quantity",
-    "quote_total",
-    "status",
-    "fulfilled",
-    "rationale",
-    "operator_cash_balance_after",
-    "framework",
-}
+from multi_agent_system import RESULT_FIELDNAMES, run_evaluation
 
 
 def test_evaluation_contract(tmp_path: Path) -> None:
@@ -46,4 +32,4 @@ def test_evaluation_contract(tmp_path: Path) -> None:
         rows = list(reader)
 
     assert len(rows) == len(results)
-    assert set(reader.fieldnames or []) == REQUIRED_COLUMNS
+    assert tuple(reader.fieldnames or ()) == RESULT_FIELDNAMES